@@ -5,6 +5,7 @@ Armazena todos os caminhos de arquivos, parâmetros de modelo e listas de featur
 para facilitar a manutenção e a reprodutibilidade.
 """
 
+import os
 from datetime import date
 
 # --- 1. Caminhos dos Arquivos (Relativos à raiz do projeto) ---
@@ -15,17 +16,58 @@ PATH_PRODUTOS = 'data/raw/part-00000-tid-7173294866425216458-eae53fbf-d19e-4130-
 # --- MUDANÇA: Ajustado para refletir o retorno ao LightGBM ---
 PATH_OUTPUT = "previsao_final.parquet"
 PATH_MODELO_FINAL = "modelo_lgbm_final.joblib"
+PATH_CACHE = ".cache_fe" # Cache em disco (joblib.Memory) do DataFrame de modelagem.
+PATH_CACHE_TOP_PARES = "data/cache" # Rankings de pares PDV/Produto já calculados.
+# Datasets de tuning binarizados pelo LightGBM, compartilhados entre os workers do Optuna.
+# Ficam em um subdiretório próprio, separado dos arquivos do joblib.Memory.
+PATH_CACHE_TUNING = os.path.join(PATH_CACHE, "tuning")
+PATH_DATASET_TREINO = os.path.join(PATH_CACHE_TUNING, "dtrain.bin")
+PATH_DATASET_VALID = os.path.join(PATH_CACHE_TUNING, "dvalid.bin")
+PATH_Y_VALID = os.path.join(PATH_CACHE_TUNING, "y_valid.npy")
 
 
 # --- 2. Parâmetros do Modelo LightGBM ---
+# Dispositivo de treino: 'cuda' usa a construção de histogramas em GPU (requer o LightGBM
+# compilado com suporte a CUDA). Sem a variável de ambiente LGBM_DEVICE, um treino mínimo de
+# teste decide: se o build (ex.: o 'lightgbm' padrão do PyPI) ou a máquina não suportam CUDA, cai para 'cpu'.
+def _detectar_dispositivo_lgbm() -> str:
+    if "LGBM_DEVICE" in os.environ:
+        return os.environ["LGBM_DEVICE"]
+    import lightgbm as lgb
+    import numpy as np
+    try:
+        dados_de_teste = lgb.Dataset(np.random.rand(100, 2), label=np.random.rand(100), params={'verbosity': -1})
+        lgb.train({'device_type': 'cuda', 'verbosity': -1}, dados_de_teste, num_boost_round=1)
+        dispositivo = "cuda"
+    except lgb.basic.LightGBMError:
+        dispositivo = "cpu"
+    # Exporta o resultado para que os workers do Optuna (subprocessos) não repitam o teste.
+    os.environ["LGBM_DEVICE"] = dispositivo
+    return dispositivo
+
+LGBM_DEVICE = _detectar_dispositivo_lgbm()
+LGBM_DEVICE_PARAMS = {'device_type': LGBM_DEVICE}
+if LGBM_DEVICE != 'cpu':
+    LGBM_DEVICE_PARAMS['gpu_use_dp'] = False # Precisão simples nos histogramas da GPU
+
+# Parâmetros de binarização do Dataset (fixados na construção, não podem mudar entre trials).
+# Menos bins reduzem a memória dos histogramas e o custo da busca de splits, principalmente na GPU.
+# 'feature_pre_filter' descarta na construção as features que não podem gerar splits.
+LGBM_DATASET_PARAMS = {
+    'max_bin': 63 if LGBM_DEVICE != 'cpu' else 128,
+    'feature_pre_filter': True
+}
+
 # Parâmetros base para o LightGBM, que serão otimizados pelo Optuna.
 LGBM_PARAMS = {
-    'objective': 'regression_l1', # Usamos MAE (l1) que performa bem com log transform
-    'metric': 'mae',
+    'objective': 'regression', # L2 sobre o alvo em log1p: gradiente suave, converge em menos rodadas
+    'metric': 'None', # A parada antecipada acompanha o WMAPE customizado, na escala original
     'n_estimators': 2000,
     'random_state': 42,
     'n_jobs': -1,
-    'verbosity': -1
+    'verbosity': -1,
+    **LGBM_DEVICE_PARAMS,
+    **LGBM_DATASET_PARAMS
 }
 
 
@@ -47,5 +89,14 @@ FERIADOS_2022 = [
     date(2022, 11, 2), date(2022, 11, 15)
 ]
 
+# Seleção dos pares PDV/Produto a prever (ver 'src/submission.py').
+SELECAO_LIMITE_DE_PARES = 300000
+SELECAO_SEMANAS_RECENTES = 8 # Janela da estratégia 'recent-weeks'.
+
 # --- 5. Configurações da Otimização (Optuna) ---
-OPTUNA_N_TRIALS = 50 # Número de tentativas que o Optuna fará.
\ No newline at end of file
+OPTUNA_N_TRIALS = 50 # Número de tentativas que o Optuna fará.
+OPTUNA_N_WORKERS = 4 # Processos de otimização em paralelo; cada um usa cpu_count // OPTUNA_N_WORKERS threads.
+OPTUNA_STUDY_NAME = "lgbm_wmape"
+OPTUNA_JOURNAL_PATH = "optuna_journal.log" # Journal do estudo, compartilhado entre os workers e recriado a cada otimização.
+# Rodadas de boosting mínimas antes que o HyperbandPruner possa interromper uma trial.
+OPTUNA_PRUNER_MIN_RESOURCE = 100
@@ -1,10 +1,21 @@
-# generate_submission.py (VERSÃO V5 - Seleção por Relevância Recente)
+# generate_submission.py (VERSÃO V6 - Seleção de Pares Parametrizável)
+import os
+# Fixa explicitamente o pool de threads do Polars; precisa ser definido antes do primeiro import do polars.
+os.environ.setdefault("POLARS_MAX_THREADS", str(os.cpu_count()))
+
+import argparse
 import joblib
-from src import data_processing, feature_engineering, predict
+from src import cache, predict, submission
 import config
-import polars as pl
 
 def main():
+    parser = argparse.ArgumentParser(description="Gera o arquivo de submissão com as previsões de Janeiro/2023.")
+    parser.add_argument("--selection", choices=submission.ESTRATEGIAS_DE_SELECAO, default="q4",
+                        help="Período usado para priorizar os pares PDV/Produto (padrão: q4).")
+    parser.add_argument("--limite-de-pares", type=int, default=config.SELECAO_LIMITE_DE_PARES,
+                        help="Quantidade de pares PDV/Produto a prever.")
+    args = parser.parse_args()
+
     print(f"Carregando modelo treinado de: {config.PATH_MODELO_FINAL}")
     try:
         final_model = joblib.load(config.PATH_MODELO_FINAL)
@@ -13,28 +24,19 @@ def main():
         return
 
     print("\nRecarregando e processando dados para consistência...")
-    df_completo = data_processing.load_and_join_data()
-    df_semanal_corrigido = data_processing.clean_and_aggregate(df_completo)
-    df_modelagem = feature_engineering.create_features(df_semanal_corrigido)
+    df_modelagem = cache.load_modeling_frame()
 
-    # --- MUDANÇA ESTRATÉGICA: Seleção baseada nas vendas do ÚLTIMO TRIMESTRE ---
-    print("\nPriorizando combinações com base na relevância recente (Q4 2022)...")
-    vendas_recentes = df_modelagem.filter(pl.col("data").dt.month() >= 10)
-    vendas_totais_por_par = vendas_recentes.group_by(["pdv", "produto"]).agg(
-        pl.sum(config.TARGET_COLUMN).alias("vendas_totais_q4")
-    ).sort("vendas_totais_q4", descending=True)
-    
-    limite_de_pares = 300000 
-    pdv_produto_unicos_priorizados = vendas_totais_por_par.head(limite_de_pares).select(["pdv", "produto"])
+    print(f"\nPriorizando combinações pela estratégia '{args.selection}'...")
+    pdv_produto_unicos_priorizados = submission.select_top_pairs(df_modelagem, args.selection, args.limite_de_pares)
     
-    print(f"Foram selecionadas as {len(pdv_produto_unicos_priorizados)} combinações mais relevantes recentemente.")
+    print(f"Foram selecionadas as {len(pdv_produto_unicos_priorizados)} combinações mais relevantes.")
 
     df_submissao = predict.generate_predictions(final_model, df_modelagem, pdv_produto_unicos_priorizados)
     
-    df_submissao.write_parquet(config.PATH_OUTPUT)
+    submission.write_submission(df_submissao)
     print(f"\n✅ SUCESSO! Arquivo salvo em: {config.PATH_OUTPUT}")
     print(f"Total de linhas: {len(df_submissao)}")
     print(df_submissao.head())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
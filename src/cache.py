@@ -0,0 +1,45 @@
+# src/cache.py
+"""
+Módulo de cache em disco para o pipeline de dados.
+
+O resultado de 'load_and_join_data -> clean_and_aggregate -> create_features' é memoizado
+com joblib.Memory, para que 'train.py' e 'generate_submission.py' compartilhem o mesmo
+DataFrame de modelagem sem reprocessar os parquets brutos a cada execução.
+"""
+import os
+from io import BytesIO
+import joblib
+import polars as pl
+import config
+from src import data_processing, feature_engineering
+
+memory = joblib.Memory(config.PATH_CACHE, verbose=0)
+
+def _assinatura_das_entradas() -> tuple:
+    """Identifica a versão dos dados brutos e do código que os processa (caminho e data de modificação)."""
+    caminhos = [
+        config.PATH_PDV, config.PATH_TRANSACOES, config.PATH_PRODUTOS,
+        config.__file__, data_processing.__file__, feature_engineering.__file__
+    ]
+    return tuple((caminho, os.path.getmtime(caminho)) for caminho in caminhos)
+
+@memory.cache
+def _build_modeling_frame_ipc(assinatura: tuple) -> bytes:
+    """Executa o pipeline de dados completo e serializa o resultado em formato IPC (Arrow)."""
+    lf_completo = data_processing.load_and_join_data()
+    df_semanal_corrigido = data_processing.clean_and_aggregate(lf_completo)
+    df_modelagem = feature_engineering.create_features(df_semanal_corrigido)
+
+    buffer = BytesIO()
+    df_modelagem.write_ipc(buffer)
+    return buffer.getvalue()
+
+def load_modeling_frame() -> pl.DataFrame:
+    """
+    Retorna o DataFrame de modelagem, reaproveitando o cache em disco quando possível.
+
+    A chave do cache inclui a data de modificação dos parquets brutos e dos módulos de
+    processamento, de modo que qualquer alteração neles invalida o resultado salvo.
+    """
+    df_modelagem_ipc = _build_modeling_frame_ipc(_assinatura_das_entradas())
+    return pl.read_ipc(BytesIO(df_modelagem_ipc))
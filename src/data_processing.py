@@ -3,24 +3,42 @@
 Módulo responsável pelo carregamento, unificação e processamento inicial dos dados.
 """
 import polars as pl
-from datetime import date, timedelta
+from datetime import datetime, timedelta
 import config
 
-def load_and_join_data() -> pl.DataFrame:
-    """Carrega os 3 arquivos parquet e os une em um DataFrame completo."""
-    df_pdv = pl.read_parquet(config.PATH_PDV)
-    df_transacoes = pl.read_parquet(config.PATH_TRANSACOES)
-    df_produtos = pl.read_parquet(config.PATH_PRODUTOS)
-    
-    df_completo = df_transacoes.join(df_pdv, left_on="internal_store_id", right_on="pdv", how="left")
-    df_completo = df_completo.join(df_produtos, left_on="internal_product_id", right_on="produto", how="left")
+# As chaves de PDV e produto são Categorical; no Polars 1.x, o cache global de strings garante
+# que as categorias sejam compatíveis entre os frames lazy (resolvidos só no 'collect') e os
+# DataFrames derivados nas etapas seguintes. A partir do 2.x as categorias já são globais.
+if int(pl.__version__.split(".")[0]) < 2:
+    pl.enable_string_cache()
+
+def load_and_join_data() -> pl.LazyFrame:
+    """Monta o plano lazy que lê os 3 arquivos parquet e os une em um frame completo."""
+    # Projeta apenas as colunas usadas a jusante, para que só elas sejam descomprimidas do parquet.
+    lf_transacoes = pl.scan_parquet(config.PATH_TRANSACOES).select([
+        "transaction_date", "internal_store_id", "internal_product_id", "quantity", "net_value"
+    ])
+    lf_pdv = pl.scan_parquet(config.PATH_PDV).select("pdv")
+    lf_produtos = pl.scan_parquet(config.PATH_PRODUTOS).select("produto")
+
+    # As chaves de PDV e produto viram Categorical (códigos UInt32), para que os joins e os
+    # agrupamentos seguintes comparem inteiros de 4 bytes em vez de strings de tamanho variável.
+    lf_transacoes = lf_transacoes.with_columns(
+        pl.col("internal_store_id").cast(pl.Utf8).cast(pl.Categorical),
+        pl.col("internal_product_id").cast(pl.Utf8).cast(pl.Categorical)
+    )
+    lf_pdv = lf_pdv.with_columns(pl.col("pdv").cast(pl.Utf8).cast(pl.Categorical))
+    lf_produtos = lf_produtos.with_columns(pl.col("produto").cast(pl.Utf8).cast(pl.Categorical))
+
+    lf_completo = lf_transacoes.join(lf_pdv, left_on="internal_store_id", right_on="pdv", how="left")
+    lf_completo = lf_completo.join(lf_produtos, left_on="internal_product_id", right_on="produto", how="left")
     
-    print("Dados brutos carregados e unidos com sucesso.")
-    return df_completo
+    print("Plano de leitura e união dos dados brutos montado com sucesso.")
+    return lf_completo
 
-def clean_and_aggregate(df_completo: pl.DataFrame) -> pl.DataFrame:
+def clean_and_aggregate(lf_completo: pl.LazyFrame) -> pl.DataFrame:
     """Limpa, agrega os dados para o nível semanal e corrige o outlier."""
-    df_essencial = df_completo.select([
+    lf_essencial = lf_completo.select([
         pl.col("transaction_date").cast(pl.Datetime).alias("data"),
         pl.col("internal_store_id").alias("pdv"),
         pl.col("internal_product_id").alias("produto"),
@@ -28,20 +46,25 @@ def clean_and_aggregate(df_completo: pl.DataFrame) -> pl.DataFrame:
         pl.col("net_value")
     ]).drop_nulls()
 
-    df_semanal = df_essencial.group_by(
+    # Leitura, união e agregação são executadas em um único plano pelo motor de streaming,
+    # limitando o pico de memória; só o resultado semanal é materializado.
+    df_semanal = lf_essencial.group_by(
         [pl.col("data").dt.truncate("1w"), "pdv", "produto"]
     ).agg([
         pl.sum("quantidade").alias("quantidade_semanal"),
         pl.sum("net_value").alias("net_value_semanal")
-    ])
+    ]).collect(engine="streaming")
 
     # Correção do Outlier de Setembro de 2022
-    data_pico = date(2022, 9, 5)
+    # A semana do pico é substituída integralmente pela semana anterior. Não reordenamos o
+    # frame inteiro aqui: 'create_features' já ordena por (pdv, produto, data) antes das janelas.
+    # As datas são comparadas direto com a coluna Datetime, sem extrair '.dt.date()' a cada filtro.
+    data_pico = datetime(2022, 9, 5)
     data_anterior = data_pico - timedelta(weeks=1)
-    dados_semana_anterior = df_semanal.filter(pl.col("data").dt.date() == data_anterior)
+    dados_semana_anterior = df_semanal.filter(pl.col("data") == data_anterior)
     dados_corrigidos = dados_semana_anterior.with_columns(pl.lit(data_pico).cast(pl.Datetime).alias("data"))
-    df_semanal_sem_pico = df_semanal.filter(pl.col("data").dt.date() != data_pico)
-    df_semanal_corrigido = pl.concat([df_semanal_sem_pico, dados_corrigidos]).sort("data")
+    df_semanal_sem_pico = df_semanal.filter(pl.col("data") != data_pico)
+    df_semanal_corrigido = pl.concat([df_semanal_sem_pico, dados_corrigidos], rechunk=False)
     
     print("Dados agregados para o nível semanal e outlier corrigido.")
     return df_semanal_corrigido
\ No newline at end of file
@@ -3,51 +3,84 @@
 Módulo para a criação de todos os atributos (features) para o modelo.
 """
 import polars as pl
+import numpy as np
 from datetime import date, timedelta
 import config
 
 def create_features(df_semanal: pl.DataFrame) -> pl.DataFrame:
     """Cria um DataFrame de modelagem enriquecido com features preditivas."""
+    # Ordena uma única vez pela série temporal de cada par; todas as janelas abaixo
+    # usam a mesma partição e são avaliadas em um único 'with_columns', permitindo
+    # ao Polars reaproveitar o agrupamento em vez de reparticionar o frame a cada feature.
+    chaves = ["pdv", "produto"]
+    qtd_lag_1 = pl.col("quantidade_semanal").shift(1)
+
     # --- 1. Feature de Preço ---
-    df_com_preco = df_semanal.with_columns(
-        (pl.col("net_value_semanal") / pl.when(pl.col("quantidade_semanal") > 0).then(pl.col("quantidade_semanal")).otherwise(1)).alias("preco_medio_semanal")
-    )
-    df_com_preco = df_com_preco.with_columns(
-        pl.col("preco_medio_semanal").shift(1).over(["pdv", "produto"]).alias("preco_lag_1_semana")
-    ).with_columns(
-        pl.col("preco_lag_1_semana").fill_null(strategy="mean")
+    # '_d' é a data (sem horário) extraída uma única vez; todos os campos de calendário e o
+    # teste de feriado derivam dela, em vez de cada um reprocessar a coluna Datetime.
+    df_com_preco = df_semanal.sort(["pdv", "produto", "data"]).with_columns(
+        (pl.col("net_value_semanal") / pl.when(pl.col("quantidade_semanal") > 0).then(pl.col("quantidade_semanal")).otherwise(1)).alias("preco_medio_semanal"),
+        pl.col("data").cast(pl.Date).alias("_d")
     )
 
     # --- 2. Features de Tempo, Lag e Estatísticas ---
     df_modelagem = df_com_preco.with_columns([
         # MUDANÇA: Novas Features de Calendário Detalhadas
-        pl.col("data").dt.day().alias("dia_do_mes"),
-        pl.col("data").dt.weekday().alias("dia_da_semana"),
-        pl.col("data").dt.week().alias("semana_do_ano"),
-        pl.col("data").dt.month().alias("mes"),
+        pl.col("_d").dt.day().alias("dia_do_mes"),
+        pl.col("_d").dt.weekday().alias("dia_da_semana"),
+        pl.col("_d").dt.week().alias("semana_do_ano"),
+        pl.col("_d").dt.month().alias("mes"),
+
+        # Lag de Preço
+        pl.col("preco_medio_semanal").shift(1).over(chaves).alias("preco_lag_1_semana"),
         
         # Lags de Vendas
-        pl.col("quantidade_semanal").shift(1).over(["pdv", "produto"]).alias("lag_1_semana"),
-        pl.col("quantidade_semanal").shift(2).over(["pdv", "produto"]).alias("lag_2_semanas"),
-        pl.col("quantidade_semanal").shift(4).over(["pdv", "produto"]).alias("lag_4_semanas"),
+        qtd_lag_1.over(chaves).alias("lag_1_semana"),
+        pl.col("quantidade_semanal").shift(2).over(chaves).alias("lag_2_semanas"),
+        pl.col("quantidade_semanal").shift(4).over(chaves).alias("lag_4_semanas"),
 
         # MUDANÇA: Novas Features Estatísticas de Janela Móvel
-        pl.col("quantidade_semanal").shift(1).rolling_mean(window_size=4).over(["pdv", "produto"]).alias("media_movel_4_semanas"),
-        pl.col("quantidade_semanal").shift(1).rolling_std(window_size=4).over(["pdv", "produto"]).alias("desvio_padrao_movel_4_semanas"),
-        pl.col("quantidade_semanal").shift(1).rolling_min(window_size=4).over(["pdv", "produto"]).alias("min_movel_4_semanas"),
-        pl.col("quantidade_semanal").shift(1).rolling_max(window_size=4).over(["pdv", "produto"]).alias("max_movel_4_semanas"),
-    ])
+        qtd_lag_1.rolling_mean(window_size=4).over(chaves).alias("media_movel_4_semanas"),
+        qtd_lag_1.rolling_std(window_size=4).over(chaves).alias("desvio_padrao_movel_4_semanas"),
+        qtd_lag_1.rolling_min(window_size=4).over(chaves).alias("min_movel_4_semanas"),
+        qtd_lag_1.rolling_max(window_size=4).over(chaves).alias("max_movel_4_semanas"),
+    ]).with_columns(
+        pl.col("preco_lag_1_semana").fill_null(strategy="mean")
+    )
 
     # --- 3. Feature de Feriados ---
+    # Uma semana contém feriado quando a segunda-feira que a inicia coincide com a
+    # segunda-feira da semana de algum feriado. Pré-calculamos essas datas uma única vez
+    # e usamos um 'is_in' vetorizado, sem chamadas Python por linha. A coluna 'data' já vem
+    # truncada para o início da semana em 'clean_and_aggregate'.
+    semanas_com_feriado = sorted({f - timedelta(days=f.weekday()) for f in config.FERIADOS_2022})
     df_modelagem = df_modelagem.with_columns(
-        pl.col("data").dt.date().map_elements(
-            lambda d: any(abs((d + timedelta(days=i) - f).days) < 1 for f in config.FERIADOS_2022 for i in range(7)),
-            return_dtype=pl.Boolean
-        ).alias("contem_feriado")
-    )
+        pl.col("_d").is_in(semanas_com_feriado).alias("contem_feriado")
+    ).drop("_d")
     
     # --- 4. Limpeza Final ---
     df_modelagem = df_modelagem.drop_nulls()
 
+    # --- 5. Tipos Compactos ---
+    # O LightGBM binariza as features de qualquer forma, então Float32/Int16/UInt8 preservam
+    # o resultado com metade (ou menos) dos bytes; a matriz de features vira um array float32.
+    features_calendario = ["dia_do_mes", "dia_da_semana", "semana_do_ano", "mes"]
+    features_float = [f for f in config.FEATURES if f not in features_calendario + ["contem_feriado"]]
+    df_modelagem = df_modelagem.with_columns(
+        [pl.col(c).cast(pl.Float32) for c in features_float]
+        + [pl.col(c).cast(pl.Int16) for c in features_calendario]
+        + [pl.col("contem_feriado").cast(pl.UInt8)]
+    )
+
     print("Features de modelagem (com features avançadas) criadas com sucesso.")
-    return df_modelagem
\ No newline at end of file
+    return df_modelagem
+
+def build_feature_matrix(df_modelagem: pl.DataFrame) -> np.ndarray:
+    """
+    Converte as colunas de 'config.FEATURES' em uma matriz float32 contígua por coluna (ordem Fortran).
+
+    É o único ponto de conversão Polars -> NumPy do projeto: treino, validação e previsão usam o
+    mesmo layout, que o LightGBM consome sem cópia intermediária via pandas.
+    """
+    X = df_modelagem.select(config.FEATURES).to_numpy(order="fortran")
+    return np.asarray(X, dtype=np.float32, order="F")
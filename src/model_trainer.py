@@ -6,22 +6,123 @@ from datetime import timedelta
 from sklearn.metrics import mean_absolute_error
 import joblib
 import config
+from src.feature_engineering import build_feature_matrix
+from src.transforms import log1p_clip0
 import optuna
+from optuna_integration import LightGBMPruningCallback
+import math
+import os
+import subprocess
+import sys
+import argparse
+from numba import njit
 from tqdm import tqdm # Para a barra de progresso
 
-def tune_hyperparameters(df_modelagem: pl.DataFrame) -> dict:
+# Kernel serial: ele é chamado a cada iteração de boosting por vários workers simultâneos, que já
+# ocupam todos os núcleos.
+@njit(fastmath=True, cache=True)
+def _wmape_from_log(y_true: np.ndarray, preds_log: np.ndarray, denominador: float) -> float:
+    """
+    Calcula o WMAPE a partir de previsões em escala log, em uma única passada sobre os dados e
+    sem alocar arrays temporários. 'denominador' (soma de |y_true|) não muda entre iterações,
+    por isso é calculado uma única vez por quem chama.
+    """
+    numerador = 0.0
+    for i in range(y_true.shape[0]):
+        pred = math.expm1(preds_log[i])
+        if pred < 0.0:
+            pred = 0.0
+        numerador += abs(y_true[i] - pred)
+    return numerador / denominador
+
+# Compila o kernel na importação, para que a primeira trial do Optuna não pague o custo do JIT.
+_wmape_from_log(np.ones(10), np.zeros(10), 10.0)
+
+def _create_or_load_study(seed: int = 42) -> optuna.Study:
+    """Cria (ou reabre) o estudo do Optuna persistido em um journal em arquivo e compartilhado entre os workers."""
+    return optuna.create_study(
+        study_name=config.OPTUNA_STUDY_NAME,
+        # Journal em arquivo: log de append-only, sem as transações e a disputa de lock do SQLite
+        # quando vários workers gravam trials ao mesmo tempo.
+        storage=optuna.storages.JournalStorage(
+            optuna.storages.journal.JournalFileBackend(config.OPTUNA_JOURNAL_PATH)
+        ),
+        load_if_exists=True,
+        direction="minimize",
+        # TPE multivariado modela a correlação entre hiperparâmetros (learning_rate x num_leaves);
+        # 'constant_liar' evita que trials paralelas proponham os mesmos pontos.
+        sampler=optuna.samplers.TPESampler(
+            multivariate=True, group=True, constant_liar=True,
+            n_startup_trials=min(10, config.OPTUNA_N_TRIALS // 3), seed=seed
+        ),
+        pruner=optuna.pruners.HyperbandPruner(
+            min_resource=config.OPTUNA_PRUNER_MIN_RESOURCE, max_resource=2000, reduction_factor=3
+        )
+    )
+
+def _prepare_tuning_data(df_modelagem: pl.DataFrame, X_all: np.ndarray, y_all: np.ndarray) -> None:
+    """
+    Constrói uma única vez os Datasets de treino e validação e os salva em formato binário
+    do LightGBM, já binarizados, para que todos os workers os carreguem sem refazer o trabalho.
+    """
     data_de_corte = df_modelagem.get_column("data").max() - timedelta(weeks=4)
-    treino = df_modelagem.filter(pl.col("data") < data_de_corte)
-    validacao = df_modelagem.filter(pl.col("data") >= data_de_corte)
-    X_treino = treino.select(config.FEATURES).to_pandas()
-    y_treino = treino.select(config.TARGET_COLUMN).to_pandas().squeeze()
-    X_valid = validacao.select(config.FEATURES).to_pandas()
-    y_valid = validacao.select(config.TARGET_COLUMN).to_pandas().squeeze()
+    # A matriz de features (já construída uma única vez pelo chamador) é dividida por máscara
+    # temporal, em vez de filtrar o DataFrame e converter treino e validação separadamente.
+    mascara_treino = (df_modelagem.get_column("data") < data_de_corte).to_numpy()
+    # A indexação por máscara devolve arrays em ordem C; voltamos à ordem Fortran (coluna a coluna),
+    # que o LightGBM lê direto ao binarizar cada feature, sem fazer sua própria cópia transposta.
+    X_treino, y_treino = np.asfortranarray(X_all[mascara_treino]), y_all[mascara_treino]
+    X_valid, y_valid = np.asfortranarray(X_all[~mascara_treino]), y_all[~mascara_treino]
+
+    # O alvo em escala log não depende dos hiperparâmetros: calculado uma única vez. Em float32,
+    # mesma precisão que o LightGBM usa internamente para os rótulos (evita uma conversão/cópia).
+    y_treino_log = np.empty(y_treino.shape[0], dtype=np.float32)
+    y_valid_log = np.empty(y_valid.shape[0], dtype=np.float32)
+    log1p_clip0(y_treino, y_treino_log)
+    log1p_clip0(y_valid, y_valid_log)
+
+    dtrain = lgb.Dataset(X_treino, label=y_treino_log, feature_name=config.FEATURES,
+                         params=config.LGBM_DATASET_PARAMS)
+    dvalid = lgb.Dataset(X_valid, label=y_valid_log, reference=dtrain, feature_name=config.FEATURES,
+                         params=config.LGBM_DATASET_PARAMS)
+    os.makedirs(config.PATH_CACHE_TUNING, exist_ok=True)
+    # 'save_binary' não sobrescreve um arquivo existente (só emite um aviso): sem remover os
+    # Datasets da execução anterior, os workers os carregariam junto com o 'y_valid' novo.
+    for caminho in (config.PATH_DATASET_TREINO, config.PATH_DATASET_VALID):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    dtrain.save_binary(config.PATH_DATASET_TREINO)
+    dvalid.save_binary(config.PATH_DATASET_VALID)
+    # O WMAPE é medido contra o alvo original (não o log), guardado à parte.
+    np.save(config.PATH_Y_VALID, y_valid)
+
+def run_tuning_worker(n_workers: int = 1, worker_id: int = 0) -> None:
+    """
+    Executa trials do estudo compartilhado até que ele atinja 'config.OPTUNA_N_TRIALS'
+    trials finalizadas, somando as de todos os workers.
+    """
+    # Datasets já binarizados por '_prepare_tuning_data', reaproveitados em todas as trials:
+    # só os hiperparâmetros mudam entre elas, não os dados.
+    dtrain = lgb.Dataset(config.PATH_DATASET_TREINO, params=config.LGBM_DATASET_PARAMS, free_raw_data=False)
+    dvalid = lgb.Dataset(config.PATH_DATASET_VALID, reference=dtrain,
+                         params=config.LGBM_DATASET_PARAMS, free_raw_data=False)
+    dtrain.construct()
+    dvalid.construct()
+    y_valid = np.load(config.PATH_Y_VALID)
+    soma_abs_y_valid = float(np.abs(y_valid).sum())
+
+    # Divide os núcleos entre os workers para que não disputem a CPU.
+    threads_por_trial = max(1, (os.cpu_count() or 1) // n_workers)
+
+    def wmape_eval(preds_log: np.ndarray, eval_data: lgb.Dataset) -> tuple:
+        """Métrica customizada do LightGBM: WMAPE na escala original, reportada a cada iteração."""
+        return 'wmape', _wmape_from_log(y_valid, preds_log, soma_abs_y_valid), False
 
     def objective(trial: optuna.Trial) -> float:
         params = {
-            'objective': 'regression_l1', 'metric': 'mae', 'n_estimators': 2000,
-            'random_state': 42, 'n_jobs': -1, 'verbosity': -1,
+            'objective': 'regression', 'metric': 'None',
+            'random_state': 42, 'n_jobs': threads_por_trial, 'verbosity': -1,
+            **config.LGBM_DEVICE_PARAMS,
             'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.05),
             'num_leaves': trial.suggest_int('num_leaves', 10, 40),
             'subsample': trial.suggest_float('subsample', 0.6, 0.9),
@@ -29,36 +130,82 @@ def tune_hyperparameters(df_modelagem: pl.DataFrame) -> dict:
             'reg_alpha': trial.suggest_float('reg_alpha', 0.0, 1.0),
             'reg_lambda': trial.suggest_float('reg_lambda', 0.0, 1.0),
         }
-        y_train_log = np.log1p(y_train.clip(0))
-        model = lgb.LGBMRegressor(**params)
-        model.fit(X_treino, y_train_log, eval_set=[(X_valid, np.log1p(y_valid.clip(0)))],
-                  callbacks=[lgb.early_stopping(100, verbose=False)])
-        preds_log = model.predict(X_valid)
-        preds = np.expm1(preds_log)
-        preds[preds < 0] = 0
-        wmape_score = np.sum(np.abs(y_valid - preds)) / np.sum(np.abs(y_valid))
+        # O callback reporta o WMAPE de validação a cada iteração, permitindo ao pruner
+        # interromper cedo as trials claramente piores que as demais.
+        pruning_cb = LightGBMPruningCallback(trial, metric="wmape", valid_name="valid_0")
+        model = lgb.train(params, dtrain, num_boost_round=2000, valid_sets=[dvalid], feval=wmape_eval,
+                          callbacks=[lgb.early_stopping(100, verbose=False), pruning_cb])
+        # O WMAPE da melhor iteração já foi calculado pela métrica customizada durante o treino,
+        # dispensando uma nova previsão sobre a validação.
+        wmape_score = model.best_score["valid_0"]["wmape"]
         return wmape_score
 
-    pbar = tqdm(total=config.OPTUNA_N_TRIALS, desc="Otimizando Hiperparâmetros")
-    study = optuna.create_study(direction="minimize")
-    study.optimize(lambda trial: (pbar.update(1), objective(trial))[1], n_trials=config.OPTUNA_N_TRIALS)
+    # Sementes distintas por worker, para que as trials iniciais (aleatórias) não se repitam.
+    study = _create_or_load_study(seed=42 + worker_id)
+    # O limite é global: conta as trials finalizadas (completas ou podadas) de todos os workers.
+    limite_de_trials = optuna.study.MaxTrialsCallback(
+        config.OPTUNA_N_TRIALS, states=(optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    )
+    pbar = tqdm(total=config.OPTUNA_N_TRIALS, desc=f"Otimizando Hiperparâmetros (worker {worker_id})")
+    study.optimize(lambda trial: (pbar.update(1), objective(trial))[1], callbacks=[limite_de_trials],
+                   gc_after_trial=False)
     pbar.close()
 
+def tune_hyperparameters(df_modelagem: pl.DataFrame, X_all: np.ndarray, y_all: np.ndarray,
+                         n_workers: int = config.OPTUNA_N_WORKERS) -> dict:
+    """
+    Otimiza os hiperparâmetros com o Optuna. Com mais de um worker, dispara 'n_workers'
+    processos independentes ('python -m src.model_trainer') sobre o mesmo estudo persistido.
+    """
+    _prepare_tuning_data(df_modelagem, X_all, y_all)
+    # Cada execução começa um estudo novo: trials de execuções anteriores podem ter sido
+    # avaliadas sobre outros dados/features e não são comparáveis às desta.
+    if os.path.exists(config.OPTUNA_JOURNAL_PATH):
+        os.remove(config.OPTUNA_JOURNAL_PATH)
+
+    if n_workers <= 1:
+        run_tuning_worker()
+    else:
+        workers = [
+            subprocess.Popen([sys.executable, "-m", "src.model_trainer",
+                              "--workers", str(n_workers), "--worker-id", str(worker_id)])
+            for worker_id in range(n_workers)
+        ]
+        codigos_de_saida = [worker.wait() for worker in workers]
+        if any(codigo != 0 for codigo in codigos_de_saida):
+            raise RuntimeError(f"Falha em worker(s) de otimização. Códigos de saída: {codigos_de_saida}")
+
+    study = _create_or_load_study()
     print(f"\nMelhor score (WMAPE Validação): {study.best_value:.6f}")
     print(f"Melhores parâmetros: {study.best_params}")
     return study.best_params
 
-def train_final_model(df_modelagem: pl.DataFrame, best_params: dict):
+def build_training_arrays(df_modelagem: pl.DataFrame) -> tuple:
+    """Materializa, uma única vez por execução, a matriz de features (float32) e o alvo (float64)."""
+    X_all = build_feature_matrix(df_modelagem)
+    y_all = df_modelagem.get_column(config.TARGET_COLUMN).to_numpy().astype(np.float64)
+    return X_all, y_all
+
+def train_final_model(X_final: np.ndarray, y_final: np.ndarray, best_params: dict):
     # Lógica para treinar o modelo final com LightGBM
-    X_final = df_modelagem.select(config.FEATURES).to_pandas()
-    y_final = df_modelagem.select(config.TARGET_COLUMN).to_pandas().squeeze()
-    y_final_log = np.log1p(y_final.clip(0))
+    y_final_log = np.empty(y_final.shape[0], dtype=np.float32)
+    log1p_clip0(y_final, y_final_log)
     final_params = config.LGBM_PARAMS.copy()
-    final_params['objective'] = 'regression_l1'
     final_params.update(best_params)
-    final_model = lgb.LGBMRegressor(**final_params)
+    # API nativa (mesma do tuning): o número de rodadas sai dos parâmetros e vira 'num_boost_round'.
+    num_boost_round = final_params.pop('n_estimators')
+    dfinal = lgb.Dataset(X_final, label=y_final_log, feature_name=config.FEATURES)
     print("\nTreinando modelo final com parâmetros otimizados (em escala log)...")
-    final_model.fit(X_final, y_final_log)
-    joblib.dump(final_model, config.PATH_MODELO_FINAL)
+    final_model = lgb.train(final_params, dfinal, num_boost_round=num_boost_round)
+    # LZ4 reduz bastante o artefato com custo de compressão/descompressão desprezível.
+    joblib.dump(final_model, config.PATH_MODELO_FINAL, compress=('lz4', 3))
     print(f"Modelo final otimizado salvo em: {config.PATH_MODELO_FINAL}")
-    return final_model
\ No newline at end of file
+    return final_model
+
+if __name__ == "__main__":
+    # Ponto de entrada de cada worker de otimização disparado por 'tune_hyperparameters'.
+    parser = argparse.ArgumentParser(description="Worker de otimização de hiperparâmetros (Optuna).")
+    parser.add_argument("--workers", type=int, default=1, help="Total de workers em execução.")
+    parser.add_argument("--worker-id", type=int, default=0, help="Índice deste worker.")
+    args = parser.parse_args()
+    run_tuning_worker(n_workers=args.workers, worker_id=args.worker_id)
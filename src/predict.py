@@ -1,6 +1,6 @@
 # src/predict.py
 """
-Módulo para gerar as previsões futuras usando um modelo Booster nativo do XGBoost.
+Módulo para gerar as previsões futuras usando o modelo LightGBM treinado.
 
 A principal função, 'generate_predictions', implementa um loop iterativo.
 Neste loop, a previsão de uma semana é usada para construir as features da
@@ -9,18 +9,17 @@ futuro mais robusto e preciso.
 """
 
 import polars as pl
-import pandas as pd
 import numpy as np
-from datetime import date, timedelta
-import config
-import xgboost as xgb
+from datetime import date, datetime, timedelta
+from src.feature_engineering import build_feature_matrix
+from src.transforms import expm1_clip0_round
 
 def generate_predictions(model, df_modelagem: pl.DataFrame, pdv_produto_unicos: pl.DataFrame) -> pl.DataFrame:
     """
-    Usa um modelo Booster treinado para gerar as previsões para as 5 semanas de Janeiro/2023.
+    Usa o modelo treinado para gerar as previsões para as 5 semanas de Janeiro/2023.
 
     Args:
-        model: O artefato do modelo XGBoost já treinado (objeto Booster).
+        model: O modelo LightGBM já treinado (objeto Booster, alvo em escala log1p).
         df_modelagem (pl.DataFrame): O DataFrame completo com features, usado como
                                      fonte para o histórico recente e para a lista de produtos.
         pdv_produto_unicos (pl.DataFrame): DataFrame contendo os pares PDV/Produto prioritários
@@ -33,72 +32,101 @@ def generate_predictions(model, df_modelagem: pl.DataFrame, pdv_produto_unicos:
     print("\nPreparando os DataFrames para Janeiro/2023...")
 
     # --- 1. Preparar histórico recente e esqueleto do futuro ---
-    # Filtra as últimas semanas de 2022 para "semear" as features de lag para janeiro.
-    ultimas_semanas_2022_hist = df_modelagem.filter(pl.col("data") > date(2022, 11, 28))
+    # Filtra as últimas semanas de 2022 para "semear" as features de lag para janeiro. Só interessam
+    # os pares que serão previstos: os demais apenas inflariam as janelas recalculadas a cada semana.
+    ultimas_semanas_2022_hist = df_modelagem.filter(pl.col("data") > date(2022, 11, 28)).join(
+        pdv_produto_unicos.select(["pdv", "produto"]), on=["pdv", "produto"], how="semi"
+    )
 
     # Define as 5 semanas de janeiro para as quais faremos a previsão.
-    semanas_jan_2023 = [date(2023, 1, 2), date(2023, 1, 9), date(2023, 1, 16), date(2023, 1, 23), date(2023, 1, 30)]
+    semanas_jan_2023 = [datetime(2023, 1, 2), datetime(2023, 1, 9), datetime(2023, 1, 16), datetime(2023, 1, 23), datetime(2023, 1, 30)]
 
     # Cria o "esqueleto" de dados futuros, com todas as combinações de PDV/Produto para cada semana de janeiro.
     df_futuro = pdv_produto_unicos.join(pl.DataFrame({"data": semanas_jan_2023}), how="cross")
     df_futuro = df_futuro.with_columns(pl.col("data").cast(pl.Datetime))
 
+    # As features de calendário dependem apenas da data: são calculadas uma única vez para as
+    # 5 semanas, fora do loop iterativo. Não há feriados nas semanas de janeiro previstas.
+    df_futuro = df_futuro.with_columns(
+        pl.col("data").dt.day().alias("dia_do_mes"),
+        pl.col("data").dt.weekday().alias("dia_da_semana"),
+        pl.col("data").dt.week().alias("semana_do_ano"),
+        pl.col("data").dt.month().alias("mes"),
+        pl.lit(False).alias("contem_feriado")
+    )
+
     # --- 2. Alinhar schemas para garantir a concatenação ---
-    # Adiciona as colunas que faltam ao df_futuro com valores nulos para que ele tenha a mesma
-    # estrutura do DataFrame histórico.
-    colunas_que_faltam = set(df_modelagem.columns) - set(df_futuro.columns)
-    for col_nome in colunas_que_faltam:
-        df_futuro = df_futuro.with_columns(pl.lit(None).alias(col_nome))
-    
-    # Força a mesma ordem de colunas do histórico para evitar erros.
-    df_futuro = df_futuro.select(df_modelagem.columns)
+    # Adiciona as colunas que faltam ao df_futuro como nulos tipados e converte as existentes, para
+    # que ele tenha exatamente a estrutura (ordem e tipos de colunas) do DataFrame histórico.
+    df_futuro = df_futuro.select([
+        pl.col(col_nome).cast(tipo) if col_nome in df_futuro.columns else pl.lit(None, dtype=tipo).alias(col_nome)
+        for col_nome, tipo in df_modelagem.schema.items()
+    ])
 
-    # Concatena o histórico recente com o esqueleto do futuro para criar uma única timeline.
+    # Concatena o histórico recente com o esqueleto do futuro para criar uma única timeline,
+    # ordenada pela série temporal de cada par para que as janelas abaixo atuem em blocos contíguos.
     df_futuro_com_historia = pl.concat([
         ultimas_semanas_2022_hist,
         df_futuro
-    ]).sort("data", "pdv", "produto")
+    ]).sort("pdv", "produto", "data")
+
+    # Preenchemos os preços nulos das semanas futuras com o último valor conhecido do próprio par.
+    # As previsões não alteram o preço, então basta fazer isso uma única vez, antes do loop.
+    df_futuro_com_historia = df_futuro_com_historia.with_columns(
+        pl.col("preco_lag_1_semana").fill_null(strategy="forward").over(["pdv", "produto"])
+    )
 
     # --- 3. Iniciar loop de previsão iterativa ---
     print("Criando features e prevendo o futuro de forma iterativa...")
     df_previsoes_finais = []
 
-    for semana_atual in semanas_jan_2023:
-        # Para cada semana do futuro, preenchemos os valores de preço nulos com o último valor conhecido.
-        df_futuro_com_historia = df_futuro_com_historia.with_columns(
-            pl.col("preco_lag_1_semana").fill_null(strategy="forward")
-        )
+    # Só os lags e as estatísticas móveis dependem das previsões das semanas anteriores;
+    # são as únicas features recalculadas a cada semana.
+    chaves = ["pdv", "produto"]
+    qtd_lag_1 = pl.col("quantidade_semanal").shift(1)
+    features_de_janela = [
+        qtd_lag_1.over(chaves).alias("lag_1_semana"),
+        pl.col("quantidade_semanal").shift(2).over(chaves).alias("lag_2_semanas"),
+        pl.col("quantidade_semanal").shift(4).over(chaves).alias("lag_4_semanas"),
+        qtd_lag_1.rolling_mean(window_size=4).over(chaves).alias("media_movel_4_semanas"),
+        qtd_lag_1.rolling_std(window_size=4).over(chaves).alias("desvio_padrao_movel_4_semanas"),
+        qtd_lag_1.rolling_min(window_size=4).over(chaves).alias("min_movel_4_semanas"),
+        qtd_lag_1.rolling_max(window_size=4).over(chaves).alias("max_movel_4_semanas"),
+    ]
+
+    # Posições (no frame já ordenado) das linhas de cada semana futura, calculadas uma única vez,
+    # e cópia NumPy da coluna alvo, onde as previsões de cada semana são gravadas diretamente.
+    linhas_indexadas = df_futuro_com_historia.with_row_index("indice")
+    posicoes_por_semana = {
+        semana: linhas_indexadas.filter(pl.col("data") == semana).get_column("indice").to_numpy()
+        for semana in semanas_jan_2023
+    }
+    tipo_quantidade = df_futuro_com_historia.schema["quantidade_semanal"]
+    quantidade_np = np.array(df_futuro_com_historia.get_column("quantidade_semanal").cast(pl.Float64).to_numpy(), dtype=np.float64)
+    # Buffers de saída das previsões inteiras, um por semana, alocados antes do loop.
+    previsoes_por_semana = {
+        semana: np.empty(posicoes.shape[0], dtype=np.int64) for semana, posicoes in posicoes_por_semana.items()
+    }
 
-        # Criamos o conjunto completo de features para a semana que queremos prever.
-        df_para_prever = df_futuro_com_historia.with_columns([
-            pl.col("data").dt.week().alias("semana_do_ano"),
-            pl.col("data").dt.month().alias("mes"),
-            pl.col("quantidade_semanal").shift(1).over(["pdv", "produto"]).alias("lag_1_semana"),
-            pl.col("quantidade_semanal").shift(2).over(["pdv", "produto"]).alias("lag_2_semanas"),
-            pl.col("quantidade_semanal").shift(4).over(["pdv", "produto"]).alias("lag_4_semanas"),
-            pl.col("quantidade_semanal").shift(1).rolling_mean(window_size=4).over(["pdv", "produto"]).alias("media_movel_4_semanas"),
-            pl.col("quantidade_semanal").shift(1).rolling_std(window_size=4).over(["pdv", "produto"]).alias("desvio_padrao_movel_4_semanas"),
-            pl.col("quantidade_semanal").shift(1).rolling_min(window_size=4).over(["pdv", "produto"]).alias("min_movel_4_semanas"),
-            pl.col("quantidade_semanal").shift(1).rolling_max(window_size=4).over(["pdv", "produto"]).alias("max_movel_4_semanas"),
-            pl.lit(False).alias("contem_feriado")
-        ]).filter(
-            pl.col("data").dt.date() == semana_atual
+    for semana_atual in semanas_jan_2023:
+        # Recalculamos as features de janela para a semana que queremos prever. As janelas só
+        # olham para trás, então as semanas posteriores à atual ficam fora do cálculo.
+        df_para_prever = df_futuro_com_historia.filter(
+            pl.col("data") <= semana_atual
+        ).with_columns(features_de_janela).filter(
+            pl.col("data") == semana_atual
         ).fill_null(0) # Substituímos nulos restantes por 0 antes de prever.
 
-        # Prepara os dados para o formato do modelo (Pandas)
-        X_previsao_semana = df_para_prever.select(config.FEATURES).to_pandas()
+        # Prepara os dados para o formato do modelo (matriz float32, mesmo layout do treino)
+        X_previsao_semana = build_feature_matrix(df_para_prever)
 
-        # Converte para o formato DMatrix nativo do XGBoost
-        dpredict = xgb.DMatrix(X_previsao_semana)
         # O modelo prevê em escala logarítmica
-        previsoes_log = model.predict(dpredict)
+        previsoes_log = model.predict(X_previsao_semana)
 
-        # CRÍTICO: Aplica a transformação inversa (exponencial) para voltar à escala original de unidades.
-        previsoes_original = np.expm1(previsoes_log)
-
-        # Arredonda para o inteiro mais próximo e garante que não haja previsões negativas.
-        previsoes_arr = np.round(previsoes_original).astype(int)
-        previsoes_arr[previsoes_arr < 0] = 0
+        # CRÍTICO: Aplica a transformação inversa (exponencial) para voltar à escala original de unidades,
+        # garantindo que não haja previsões negativas, e arredonda para o inteiro mais próximo.
+        previsoes_arr = previsoes_por_semana[semana_atual]
+        expm1_clip0_round(previsoes_log, previsoes_arr)
 
         # Armazena o resultado da semana em um DataFrame formatado.
         df_resultado_semana = df_para_prever.select(["data", "pdv", "produto"]).with_columns(
@@ -107,10 +135,12 @@ def generate_predictions(model, df_modelagem: pl.DataFrame, pdv_produto_unicos:
         df_previsoes_finais.append(df_resultado_semana)
 
         # ATUALIZA o histórico com a previsão recém-feita para que ela possa ser usada
-        # como lag para a próxima iteração do loop.
-        df_futuro_com_historia = df_futuro_com_historia.update(
-            df_resultado_semana.rename({"quantidade": "quantidade_semanal"}),
-            on=['data', 'pdv', 'produto']
+        # como lag para a próxima iteração do loop. As linhas da semana em 'df_para_prever'
+        # estão na mesma ordem do frame completo, então basta gravar nas posições pré-calculadas,
+        # sem o join que o 'update' faria a cada semana.
+        quantidade_np[posicoes_por_semana[semana_atual]] = previsoes_arr
+        df_futuro_com_historia = df_futuro_com_historia.with_columns(
+            pl.Series("quantidade_semanal", quantidade_np, nan_to_null=True).cast(tipo_quantidade)
         )
 
     # --- 4. Consolidar e formatar a submissão final ---
@@ -123,8 +153,9 @@ def generate_predictions(model, df_modelagem: pl.DataFrame, pdv_produto_unicos:
         pl.col("data").dt.week().alias("semana")
     ).select([
         pl.col("semana"),
-        pl.col("pdv").cast(pl.Int64),
-        pl.col("produto").cast(pl.Int64),
+        # As chaves chegam como Categorical; voltamos ao texto antes de converter para inteiro.
+        pl.col("pdv").cast(pl.Utf8).cast(pl.Int64),
+        pl.col("produto").cast(pl.Utf8).cast(pl.Int64),
         pl.col("quantidade")
     ])
 
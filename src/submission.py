@@ -0,0 +1,80 @@
+# src/submission.py
+"""
+Módulo com a lógica compartilhada de geração da submissão: a seleção dos pares PDV/Produto
+prioritários e a gravação do arquivo final.
+
+As variantes de priorização são estratégias de 'select_top_pairs', escolhidas por parâmetro,
+em vez de cópias separadas do script de submissão.
+"""
+import hashlib
+import os
+import polars as pl
+from datetime import timedelta
+import config
+
+ESTRATEGIAS_DE_SELECAO = ("all", "q4", "recent-weeks")
+
+def _filtro_do_periodo(df_modelagem: pl.DataFrame, strategy: str) -> pl.Expr:
+    """Retorna o filtro de período usado para medir a relevância de cada par em uma estratégia."""
+    if strategy == "all":
+        return pl.lit(True)
+    if strategy == "q4":
+        return pl.col("data").dt.month() >= 10
+    if strategy == "recent-weeks":
+        inicio = df_modelagem.get_column("data").max() - timedelta(weeks=config.SELECAO_SEMANAS_RECENTES - 1)
+        return pl.col("data") >= inicio
+    raise ValueError(f"Estratégia de seleção desconhecida: '{strategy}'. Use uma de {ESTRATEGIAS_DE_SELECAO}.")
+
+def select_top_pairs(df_modelagem: pl.DataFrame, strategy: str, k: int) -> pl.DataFrame:
+    """
+    Retorna os 'k' pares PDV/Produto com maior venda no período definido pela estratégia.
+
+    O ranking é salvo em disco e reaproveitado quando os dados de entrada, a estratégia
+    e 'k' são os mesmos de uma execução anterior.
+
+    Args:
+        df_modelagem (pl.DataFrame): O DataFrame de modelagem com o histórico de vendas.
+        strategy (str): 'all' (ano inteiro), 'q4' (out-dez) ou 'recent-weeks'
+                        (últimas 'config.SELECAO_SEMANAS_RECENTES' semanas).
+        k (int): Quantidade de pares a selecionar.
+
+    Returns:
+        pl.DataFrame: DataFrame com as colunas 'pdv' e 'produto' dos pares selecionados.
+    """
+    filtro = _filtro_do_periodo(df_modelagem, strategy)
+
+    # Chave do cache: hash das linhas que alimentam o ranking, da estratégia e do tamanho da seleção.
+    hash_linhas = df_modelagem.select(["pdv", "produto", "data", config.TARGET_COLUMN]).hash_rows()
+    cache_key = hashlib.sha256(hash_linhas.to_numpy().tobytes()).hexdigest()[:16]
+    caminho_cache = os.path.join(config.PATH_CACHE_TOP_PARES, f"top_pairs_{strategy}_{k}_{cache_key}.parquet")
+
+    if os.path.exists(caminho_cache):
+        print(f"Ranking de pares reaproveitado do cache: {caminho_cache}")
+        return pl.read_parquet(caminho_cache)
+
+    # Filtro de período, agregação e seleção parcial (top_k, em vez de ordenar todos os pares só
+    # para manter os primeiros) em um único plano lazy, executado pelo motor de streaming.
+    pdv_produto_unicos_priorizados = df_modelagem.lazy().filter(filtro).group_by(["pdv", "produto"]).agg(
+        pl.sum(config.TARGET_COLUMN).alias("vendas_totais")
+    ).top_k(
+        k, by="vendas_totais"
+    ).select(["pdv", "produto"]).collect(engine="streaming")
+
+    os.makedirs(config.PATH_CACHE_TOP_PARES, exist_ok=True)
+    pdv_produto_unicos_priorizados.write_parquet(caminho_cache, compression="lz4")
+    return pdv_produto_unicos_priorizados
+
+def write_submission(df_submissao: pl.DataFrame, caminho: str = config.PATH_OUTPUT) -> None:
+    """Grava a submissão em parquet otimizado para leituras seletivas."""
+    # ZSTD comprime melhor que o Snappy padrão nas colunas numéricas da submissão,
+    # com velocidade de leitura equivalente. Ordenar antes de gravar, com row groups pequenos e
+    # estatísticas por coluna, permite que quem lê o arquivo descarte row groups inteiros.
+    df_submissao.sort(["pdv", "produto", "semana"]).write_parquet(
+        caminho,
+        compression="zstd",
+        compression_level=3,
+        statistics=True,
+        row_group_size=65_536,
+        use_pyarrow=True,
+        pyarrow_options={"use_dictionary": ["pdv", "produto"], "write_statistics": True}
+    )
@@ -0,0 +1,31 @@
+# src/transforms.py
+"""
+Módulo com as transformações do alvo entre a escala original (unidades) e a escala log1p
+usada pelo modelo.
+
+Cada transformação é um kernel numba que lê a entrada e grava no array de saída em uma única
+passada, sem os arrays temporários de 'np.clip' + 'np.log1p' / 'np.expm1' + 'np.round'.
+"""
+import math
+import numpy as np
+from numba import njit, prange
+
+@njit(parallel=True, fastmath=True, cache=True)
+def log1p_clip0(y: np.ndarray, saida: np.ndarray) -> None:
+    """Grava em 'saida' o log1p de 'y', tratando valores negativos (devoluções) como zero."""
+    for i in prange(y.shape[0]):
+        saida[i] = math.log1p(y[i]) if y[i] > 0.0 else 0.0
+
+@njit(parallel=True, fastmath=True, cache=True)
+def expm1_clip0_round(y_log: np.ndarray, saida: np.ndarray) -> None:
+    """
+    Converte previsões em escala log para unidades inteiras não negativas, gravando em 'saida'.
+    Funde expm1, corte em zero e arredondamento em uma única passada.
+    """
+    for i in prange(y_log.shape[0]):
+        valor = math.expm1(y_log[i])
+        saida[i] = 0 if valor < 0.5 else int(valor + 0.5)
+
+# Compila os kernels na importação, para que o primeiro uso não pague o custo do JIT.
+log1p_clip0(np.ones(10), np.empty(10, dtype=np.float32))
+expm1_clip0_round(np.zeros(10), np.empty(10, dtype=np.int64))
@@ -8,22 +8,33 @@ Passos:
 4. Treina um modelo final com os parâmetros otimizados e o salva para uso futuro.
 """
 
-from src import data_processing, feature_engineering, model_trainer
+import os
+# Fixa explicitamente o pool de threads do Polars; precisa ser definido antes do primeiro import do polars.
+os.environ.setdefault("POLARS_MAX_THREADS", str(os.cpu_count()))
+
+import argparse
+import config
+from src import cache, model_trainer
 
 def main():
     """Orquestra o pipeline completo de treinamento do modelo."""
-    # Etapa 1: Carregar e processar os dados
-    df_completo = data_processing.load_and_join_data()
-    df_semanal_corrigido = data_processing.clean_and_aggregate(df_completo)
-    
-    # Etapa 2: Criar features
-    df_modelagem = feature_engineering.create_features(df_semanal_corrigido)
+    parser = argparse.ArgumentParser(description="Treina o modelo de previsão de vendas.")
+    parser.add_argument("--workers", type=int, default=config.OPTUNA_N_WORKERS,
+                        help="Processos do Optuna executando trials em paralelo.")
+    args = parser.parse_args()
+
+    # Etapas 1 e 2: Carregar e processar os dados e criar features (com cache em disco,
+    # compartilhado com o generate_submission.py)
+    df_modelagem = cache.load_modeling_frame()
+
+    # Matriz de features e alvo convertidos uma única vez, compartilhados pelas etapas 3 e 4
+    X, y = model_trainer.build_training_arrays(df_modelagem)
     
     # Etapa 3: Otimizar os hiperparâmetros com Optuna
-    best_params = model_trainer.tune_hyperparameters(df_modelagem)
+    best_params = model_trainer.tune_hyperparameters(df_modelagem, X, y, n_workers=args.workers)
     
     # Etapa 4: Treinar e salvar o modelo final com os melhores parâmetros
-    model_trainer.train_final_model(df_modelagem, best_params)
+    model_trainer.train_final_model(X, y, best_params)
     
     print("\nPipeline de treinamento concluído com sucesso!")
 